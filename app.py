@@ -6,6 +6,8 @@
 # OPENAI_MODEL (opcional, por defecto "gpt-4o-mini")
 # ELEVEN_API_KEY (o ELEVENLABS_API_KEY)
 # ELEVEN_VOICE_ID (o ELEVENLABS_VOICE_ID)
+# ELEVEN_OUTPUT_FORMAT (opcional, por defecto "mp3_44100_128"; "ulaw_8000" = WAV μ-law nativo de telefonía;
+#                       admite mp3_*, ulaw_*, alaw_*, pcm_*)
 # TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_E164  (p.ej. "+34930348966")
 # MONDAY_API_KEY (o monday_api)
 # MONDAY_DEFAULT_BOARD_ID=2147303762   # REOS BOT LIFEWAY (padre)
@@ -15,22 +17,43 @@
 # SUB_REOS_PHONE_COL_ID=phone_mks7jjxp
 # SUB_REOS_EMAIL_COL_ID=email_mks7kagf
 # SUB_REOS_STATUS_COL_ID=color_mkvst8na
+# SUB_CES_*_COL_ID (NAME/PHONE/EMAIL/DATE/NOLON/STATUS)  # subelementos de CESIONES (2068339939), si se usa
 # OPS_TOKEN  (para /ops/book-visit)
 #
+# Twilio (consola → número → Voice): "Call status changes" = https://<host>/status (POST).
+# Sin ese statusCallback la precarga/sesión de una llamada colgada solo se libera por SESSION_TTL.
+#
 # (Opcionales para velocidad)
 # FAST_MODE=1              # Usa <Say> para respuestas cortas (instantáneo)
 # BOARD_CACHE_TTL=60       # Cache de items Monday (segundos)
 # AUDIO_CACHE_TTL=600      # Cache de audios Eleven (segundos)
-
-import os, io, json, time, uuid, logging, re, hashlib
-from typing import Any, Dict, Optional, List
+# PREFETCH_TTL=120         # Vida de la precarga especulativa por llamada (segundos)
+# PRERENDER_INTERVAL=0     # Pre-render periódico de resúmenes en audio (segundos, 0 = off)
+# PRERENDER_WORKERS=2      # Síntesis simultáneas del pre-render (límite de Eleven)
+# PRERENDER_LANGS=es,ar,en
+# PRERENDER_DIR=/tmp/lifeway-prerender   # Audios pre-renderizados compartidos por todos los workers
+# IDEM_DIR=/tmp/lifeway-idem             # Reclamos de efectos (subitem/WhatsApp) compartidos por los workers
+# MONDAY_BUDGET_PER_MIN=2000000   # Complejidad Monday por minuto y proceso (token bucket)
+# MONDAY_BG_RESERVE=0.3    # Fracción del bucket reservada a llamadas en vivo (fondo no la usa)
+# MONDAY_CB_FAILS=5        # Fallos seguidos que abren el circuito de Monday
+# MONDAY_CB_COOLDOWN=30    # Segundos con el circuito abierto (se sirven snapshots antiguos)
+# WARM_START=1             # Precarga boards en el master de gunicorn (preload) y calienta HTTP por worker
+# ANSWER_CACHE_TTL=3600    # Cache de respuestas sin herramientas (FAQ) (segundos)
+# ANSWER_CACHE_MAX=500     # Nº máximo de respuestas cacheadas (LRU)
+# SEARCH_FEDERATED=1       # Busca en todos los boards de BOARD_MAP a la vez (y los mantiene calientes)
+# WEB_THREADS=8            # Hilos por worker de gunicorn (dimensiona el pool de búsqueda)
+
+import os, io, json, time, uuid, logging, re, hashlib, threading, struct, contextlib, fcntl
+_T0 = time.time()   # para medir time-to-ready
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, List, Tuple
 from datetime import datetime
 
 import requests
 from flask import Flask, request, Response, abort, send_file
 from twilio.twiml.voice_response import VoiceResponse, Gather
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client as TwilioClient
 
 # ------------- ENV & CONFIG -------------
 def _env_str(name: str, default: str = "") -> str:
@@ -49,6 +72,11 @@ OPENAI_MODEL     = _env_str("OPENAI_MODEL", "gpt-4o-mini")
 
 ELEVEN_API_KEY   = _env_str("ELEVEN_API_KEY") or _env_str("ELEVENLABS_API_KEY")
 ELEVEN_VOICE_ID  = _env_str("ELEVEN_VOICE_ID") or _env_str("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+ELEVEN_OUTPUT_FORMAT = _env_str("ELEVEN_OUTPUT_FORMAT", "mp3_44100_128")
+# Solo formatos que sabemos servir a Twilio: mp3 tal cual; ulaw/alaw/pcm envueltos en WAV
+if not re.fullmatch(r"mp3_\d+_\d+|(ulaw|alaw|pcm)_\d+", ELEVEN_OUTPUT_FORMAT):
+    logging.warning("ENV ELEVEN_OUTPUT_FORMAT=%s no soportado, usando mp3_44100_128", ELEVEN_OUTPUT_FORMAT)
+    ELEVEN_OUTPUT_FORMAT = "mp3_44100_128"
 
 TWILIO_ACCOUNT_SID = _env_str("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN  = _env_str("TWILIO_AUTH_TOKEN")
@@ -66,18 +94,49 @@ SUB_REOS_DATE_COL_ID   = _env_str("SUB_REOS_DATE_COL_ID")   # date0
 SUB_REOS_NOLON_COL_ID  = _env_str("SUB_REOS_NOLON_COL_ID")  # text_mkvs87qt
 SUB_REOS_STATUS_COL_ID = _env_str("SUB_REOS_STATUS_COL_ID") # color_mkvst8na
 
+# Subitems CESIONES (board 2068339939) — sin IDs por defecto: solo se crea el subelemento con título
+SUB_CES_NAME_COL_ID   = _env_str("SUB_CES_NAME_COL_ID")
+SUB_CES_PHONE_COL_ID  = _env_str("SUB_CES_PHONE_COL_ID")
+SUB_CES_EMAIL_COL_ID  = _env_str("SUB_CES_EMAIL_COL_ID")
+SUB_CES_DATE_COL_ID   = _env_str("SUB_CES_DATE_COL_ID")
+SUB_CES_NOLON_COL_ID  = _env_str("SUB_CES_NOLON_COL_ID")
+SUB_CES_STATUS_COL_ID = _env_str("SUB_CES_STATUS_COL_ID")
+
 BRAND_NAME = _env_str("BRAND_NAME", "Lifeway")
 OPS_TOKEN  = _env_str("OPS_TOKEN")
 
 # Velocidad / cachés
 FAST_MODE = _env_str("FAST_MODE", "0") == "1"
+WARM_START = _env_str("WARM_START", "1") == "1"
+
+# Monday: presupuesto de complejidad y circuit breaker
+MONDAY_BUDGET_PER_MIN = max(1, _env_int("MONDAY_BUDGET_PER_MIN", 2000000))
+try:
+    MONDAY_BG_RESERVE = min(max(float(_env_str("MONDAY_BG_RESERVE", "0.3")), 0.0), 0.9)
+except ValueError:
+    MONDAY_BG_RESERVE = 0.3
+MONDAY_CB_FAILS    = max(1, _env_int("MONDAY_CB_FAILS", 5))
+MONDAY_CB_COOLDOWN = _env_int("MONDAY_CB_COOLDOWN", 30)
 BOARD_CACHE_TTL = _env_int("BOARD_CACHE_TTL", 60)
 AUDIO_CACHE_TTL = _env_int("AUDIO_CACHE_TTL", 600)
+PREFETCH_TTL    = _env_int("PREFETCH_TTL", 120)
+ANSWER_CACHE_TTL = _env_int("ANSWER_CACHE_TTL", 3600)
+ANSWER_CACHE_MAX = _env_int("ANSWER_CACHE_MAX", 500)
+PRERENDER_INTERVAL = _env_int("PRERENDER_INTERVAL", 0)
+PRERENDER_WORKERS  = max(1, _env_int("PRERENDER_WORKERS", 2))
+SEARCH_FEDERATED   = _env_str("SEARCH_FEDERATED", "0") == "1"
+WEB_THREADS        = max(1, _env_int("WEB_THREADS", 8))
+PRERENDER_DIR      = _env_str("PRERENDER_DIR", "/tmp/lifeway-prerender")
+IDEM_DIR           = _env_str("IDEM_DIR", "/tmp/lifeway-idem")
+PRERENDER_LANGS    = [l.strip() for l in _env_str("PRERENDER_LANGS", "es,ar,en").split(",") if l.strip()]
 
 # Cache de Monday (items por board) y cache de audio (texto -> mp3 bytes)
 _BOARD_CACHE: Dict[int, Dict[str, Any]] = {}    # {board_id: {"ts":..., "items":[...]}}
 _AUDIO_MEMO: Dict[str, Dict[str, Any]] = {}      # {hash(text): {"ts":..., "bytes":...}}
 
+# Formato de salida de Eleven → (extensión, mimetype) que sirve /audio
+AUDIO_EXT, AUDIO_MIME = ("mp3", "audio/mpeg") if ELEVEN_OUTPUT_FORMAT.startswith("mp3") else ("wav", "audio/wav")
+
 # Columnas tablero padre (REOS y CESIONES opcional)
 BOARD_MAP: Dict[int, Dict[str, str]] = {
     2147303762: {  # REOS BOT LIFEWAY (padre)
@@ -113,7 +172,30 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("lifeway")
 
-_twilio = TwilioClient(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN) else None
+# twilio.rest es pesado: se importa en warm_start (master, preload) o en el primer uso
+_twilio = None
+_twilio_lock = threading.Lock()
+
+def _twilio_client():
+    global _twilio
+    if _twilio is None and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
+        with _twilio_lock:
+            if _twilio is None:
+                from twilio.rest import Client as TwilioClient
+                _twilio = TwilioClient(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return _twilio
+
+# Sesión HTTP por proceso (keep-alive con OpenAI/Eleven/Monday). Tras un fork se crea otra:
+# los sockets del master no se comparten con los workers.
+_HTTP: Dict[int, requests.Session] = {}
+
+def _http() -> requests.Session:
+    pid = os.getpid()
+    s = _HTTP.get(pid)
+    if s is None:
+        _HTTP.clear()
+        s = _HTTP[pid] = requests.Session()
+    return s
 AUDIO_STORE: Dict[str, bytes] = {}
 
 # Memoria por llamada
@@ -127,15 +209,132 @@ def _sess(call_sid: str) -> Dict[str, Any]:
     now = time.time()
     for k, v in list(SESS.items()):
         if now - (v.get("ts") or now) > SESSION_TTL:
-            SESS.pop(k, None)
+            _end_session(k)
     s["history"] = (s.get("history") or [])[-20:]
     return s
 
+def _end_session(call_sid: str):
+    """Cierra la sesión de una llamada y cancela su precarga en curso."""
+    s = SESS.pop(call_sid, None)
+    if s: prefetch_cancel(s)
+
+# ------------- Idempotencia (reintentos de Twilio) -------------
+# Si un turno pasa del timeout de Twilio, Twilio reintenta el mismo webhook. Con una clave
+# por (CallSid, turno) el reintento se engancha al cálculo en curso o recibe el TwiML ya
+# hecho (en memoria). Las herramientas con efectos (subitem, WhatsApp) usan claim_once.
+IDEM_TTL = 600
+_IDEM: Dict[str, Dict[str, Any]] = {}   # {clave: {"ts","ttl","done":Event,"ok","result"}}
+_IDEM_LOCK = threading.Lock()
+
+def idempotent(key: str, fn: Callable[[], Any], ttl: int = IDEM_TTL, wait: float = 60.0,
+               on_busy: Optional[Callable[[], Any]] = None) -> Any:
+    """Ejecuta fn una sola vez por clave. Los duplicados esperan al original (hasta wait s)
+    y reciben su resultado; si el original falla o no acaba, se usa on_busy (o fn)."""
+    now = time.time()
+    with _IDEM_LOCK:
+        for k, v in list(_IDEM.items()):
+            if v["done"].is_set() and now - v["ts"] > v["ttl"]:
+                _IDEM.pop(k, None)
+        e = _IDEM.get(key)
+        owner = e is None
+        if owner:
+            e = _IDEM[key] = {"ts": now, "ttl": ttl, "done": threading.Event(), "ok": False, "result": None}
+    if not owner:
+        log.info("idempotent: duplicado %s", key)
+        e["done"].wait(wait)
+        if e["ok"]: return e["result"]
+        return (on_busy or fn)()
+    try:
+        e["result"] = fn(); e["ok"] = True
+        return e["result"]
+    except Exception:
+        with _IDEM_LOCK: _IDEM.pop(key, None)
+        raise
+    finally:
+        e["done"].set()
+
+# Efectos con consecuencias fuera (subitem en Monday, WhatsApp): el reintento de Twilio puede
+# caer en OTRO worker, así que la clave se reclama en disco (O_CREAT|O_EXCL, atómico entre
+# procesos). Fichero vacío = en curso; con JSON = hecho, con su resultado.
+IDEM_INFLIGHT_MAX = 120     # un reclamo vacío más viejo que esto es de un worker muerto
+_IDEM_SWEEP = {"ts": 0.0}
+
+def _idem_path(key: str) -> str:
+    return os.path.join(IDEM_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+def _idem_sweep(ttl: int):
+    now = time.time()
+    if now - _IDEM_SWEEP["ts"] < 60: return
+    _IDEM_SWEEP["ts"] = now
+    for fn in os.listdir(IDEM_DIR):
+        try:
+            if now - os.path.getmtime(os.path.join(IDEM_DIR, fn)) > max(ttl, 3600):
+                os.remove(os.path.join(IDEM_DIR, fn))
+        except OSError:
+            pass
+
+def _idem_read(path: str) -> Tuple[Optional[float], Optional[Dict[str, Any]]]:
+    """(mtime, resultado) del reclamo; (None, None) si no existe."""
+    try:
+        mtime = os.path.getmtime(path)
+        with open(path, "rb") as f: raw = f.read()
+    except OSError:
+        return None, None
+    try: return mtime, (json.loads(raw) if raw else None)
+    except ValueError: return mtime, None
+
+def claim_once(key: str, fn: Callable[[], Any], ttl: int, wait: float = 30.0) -> Tuple[str, Any]:
+    """Ejecuta fn una sola vez por clave entre TODOS los workers.
+    Devuelve ("done", res) si lo ejecutó este proceso, ("dup", res) con el resultado del
+    original, o ("pending", None) si el original sigue en curso tras wait s."""
+    path = _idem_path(key)
+    try:
+        os.makedirs(IDEM_DIR, exist_ok=True)
+        _idem_sweep(ttl)
+    except OSError:
+        log.exception("claim_once: %s no disponible, dedupe solo en memoria", IDEM_DIR)
+        return "done", idempotent(key, fn, ttl=ttl, wait=wait, on_busy=lambda: None)
+    deadline = time.time() + wait
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            pass
+        mtime, done = _idem_read(path)
+        now = time.time()
+        if mtime is None:
+            continue                                  # lo acaban de liberar: reclamamos
+        if done is not None and now - mtime <= ttl:
+            log.info("claim_once: duplicado %s", key)
+            return "dup", done.get("result")
+        if (done is not None) or now - mtime > IDEM_INFLIGHT_MAX:
+            try: os.remove(path)                      # caducado o huérfano
+            except OSError: pass
+            continue
+        if now >= deadline:
+            return "pending", None
+        time.sleep(0.2)
+    os.close(fd)
+    try:
+        result = fn()
+    except Exception:
+        try: os.remove(path)                          # sin efecto hecho: que reintente otro
+        except OSError: pass
+        raise
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w") as f: json.dump({"result": result}, f)
+        os.replace(tmp, path)
+    except (OSError, TypeError):
+        log.exception("claim_once: no pude guardar %s", key)
+    return "done", result
+
 # ------------- OpenAI (rápido) -------------
 def _openai_chat(messages, temperature=0.3) -> str:
     if not OPENAI_API_KEY:
         return ""
-    r = requests.post(
+    r = _http().post(
         "https://api.openai.com/v1/chat/completions",
         headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type":"application/json"},
         json={"model": OPENAI_MODEL, "messages": messages, "temperature": temperature},
@@ -196,7 +395,7 @@ def _tool_defs():
                 "description":"Lee resumen de una propiedad (dirección, población, precio, día de visita).",
                 "parameters":{
                     "type":"object",
-                    "properties":{"item_id":{"type":"integer"}},
+                    "properties":{"item_id":{"type":"integer"}, "board_id":{"type":"integer"}},
                     "required":["item_id"]
                 },
             },
@@ -210,6 +409,7 @@ def _tool_defs():
                     "type":"object",
                     "properties":{
                         "item_id":{"type":"integer"},
+                        "board_id":{"type":"integer"},
                         "name":{"type":"string"},
                         "phone":{"type":"string"},
                         "email":{"type":"string"}
@@ -236,51 +436,61 @@ def _tool_defs():
         },
     ]
 
+def _item_for(call_sid: str, item_id: int) -> Dict[str, Any]:
+    # Si la precarga especulativa ya trajo el item, no volvemos a Monday
+    return prefetched(SESS.get(call_sid), item_id, wait=2.0).get("item") or monday_get_item(item_id)
+
 def _run_tool(name:str, args:Dict[str,Any], call_sid:str, lang:str) -> Dict[str,Any]:
     try:
         if name == "search_properties":
             board_id = int(args["board_id"])
             q = str(args["query"])
-            hit = search_flexible(board_id, q)
+            hit = find_property(board_id, q)
             if not hit:
                 return {"ok": False, "reason":"no_match"}
-            return {"ok":True, "item_id": int(hit["id"]), "name": hit.get("name")}
+            bid, it = hit
+            return {"ok":True, "item_id": int(it["id"]), "board_id": bid, "name": it.get("name")}
 
         elif name == "get_property_summary":
-            it = monday_get_item(int(args["item_id"]))
+            it = _item_for(call_sid, int(args["item_id"]))
             if not it: return {"ok":False,"reason":"not_found"}
-            text = say_summary(it, MONDAY_DEFAULT_BOARD_ID, lang)
+            text = say_summary(it, int(args.get("board_id") or MONDAY_DEFAULT_BOARD_ID), lang)
             return {"ok":True,"summary":text}
 
         elif name == "book_visit_subitem":
             item_id = int(args["item_id"])
+            board   = int(args.get("board_id") or MONDAY_DEFAULT_BOARD_ID)
             name    = (args.get("name") or "Interesado").strip()
             phone   = (args.get("phone") or "").strip()
             email   = (args.get("email") or "").strip()
-            it = monday_get_item(item_id)
+            it = _item_for(call_sid, item_id)
             if not it: return {"ok":False,"reason":"item_missing"}
-            m = BOARD_MAP.get(MONDAY_DEFAULT_BOARD_ID, BOARD_MAP[2147303762])
+            m = BOARD_MAP.get(board, BOARD_MAP[2147303762])
             fecha_iso = _get_date(it, m["fecha_visita"])
             nolon_txt = _get_text(it, m.get("nolon",""))
-            sid = create_subitem_contact(item_id, MONDAY_DEFAULT_BOARD_ID,
+            who = _digits(phone) or email.lower() or _norm(name).strip()
+            # Por llamada: deduplica reintentos, nunca une reservas de callers distintos
+            state, sid = claim_once(f"book|{call_sid}|{item_id}|{who}", lambda: create_subitem_contact(
+                                         item_id, board,
                                          title=f"{name} - {phone or 's/tel'} - {email or 's/email'}",
                                          name=name, phone=phone, email=email,
-                                         date_iso=fecha_iso, nolon_text=nolon_txt)
+                                         date_iso=fecha_iso, nolon_text=nolon_txt),
+                                    ttl=3600)
+            if state == "pending":  # el original (reintento de Twilio) aún la está creando
+                return {"ok": True, "pending": True}
             return {"ok": bool(sid), "subitem_id": sid}
 
         elif name == "send_whatsapp_brief":
-            if _twilio is None: return {"ok":False,"reason":"twilio_not_configured"}
+            if _twilio_client() is None: return {"ok":False,"reason":"twilio_not_configured"}
             phone   = str(args["phone"])
             item_id = int(args["item_id"])
             board   = int(args["board_id"])
-            it = monday_get_item(item_id)
+            pre = prefetched(SESS.get(call_sid), item_id, wait=2.0)
+            it = pre.get("item") or monday_get_item(item_id)
             if not it: return {"ok":False,"reason":"item_missing"}
-            resumen = say_summary(it, board, "es")
             try:
                 if phone.startswith("+"):
-                    wa_text(phone, "Ficha y visita:\n\n"+resumen)
-                    imgs = extract_images(it, board)
-                    if imgs: wa_images(phone, imgs)
+                    send_brief_once(phone, it, board, pre)
                 return {"ok":True}
             except Exception:
                 log.exception("send_whatsapp")
@@ -292,7 +502,11 @@ def _run_tool(name:str, args:Dict[str,Any], call_sid:str, lang:str) -> Dict[str,
         log.exception("tool_error %s", name)
         return {"ok":False,"reason":"exception"}
 
-def reason_and_act(history:List[Dict[str,str]], call_sid:str, lang:str, board_id:int)->str:
+def reason_and_act(history:List[Dict[str,str]], call_sid:str, lang:str, board_id:int,
+                   meta:Optional[Dict[str,Any]]=None)->str:
+    """meta (opcional) recibe {"tools": bool}: si el modelo respondió sin herramientas."""
+    meta = meta if meta is not None else {}
+    meta["tools"] = True
     sys = (
         f"Eres un agente de {BRAND_NAME}, cercano, rápido y útil. "
         "Tu objetivo es ayudar con inmuebles (ubicación, precio, día de visita), "
@@ -304,7 +518,7 @@ def reason_and_act(history:List[Dict[str,str]], call_sid:str, lang:str, board_id
 
     for _ in range(1):  # un solo ciclo de herramientas para bajar latencia
         try:
-            r = requests.post(
+            r = _http().post(
                 "https://api.openai.com/v1/chat/completions",
                 headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type":"application/json"},
                 json={
@@ -336,6 +550,8 @@ def reason_and_act(history:List[Dict[str,str]], call_sid:str, lang:str, board_id
                 # tras un loop, pedimos output final
                 continue
 
+            if msg.get("content"):
+                meta["tools"] = False
             return msg.get("content") or "¿En qué más puedo ayudarte?"
 
         except Exception:
@@ -351,84 +567,292 @@ def reason_and_act(history:List[Dict[str,str]], call_sid:str, lang:str, board_id
         return "¿En qué más puedo ayudarte?"
 
 # ------------- ElevenLabs TTS (con cache y FAST_MODE) -------------
-def eleven_tts_to_bytes(text: str) -> bytes:
+def _wav_wrap(raw: bytes, fmt: str) -> bytes:
+    """Cabecera RIFF/WAVE para la salida cruda de Eleven (ulaw_/alaw_/pcm_XXXXX), mono."""
+    codec, _, rate_s = fmt.partition("_")
+    rate = int(rate_s or 8000)
+    if codec in ("ulaw", "alaw"):
+        # WAVE_FORMAT_MULAW (7) / ALAW (6), 8 bits; no-PCM → fmt de 18 bytes + chunk 'fact'
+        tag = 7 if codec == "ulaw" else 6
+        fmt_chunk = struct.pack("<4sIHHIIHHH", b"fmt ", 18, tag, 1, rate, rate, 1, 8, 0)
+        fmt_chunk += struct.pack("<4sII", b"fact", 4, len(raw))
+    else:
+        fmt_chunk = struct.pack("<4sIHHIIHH", b"fmt ", 16, 1, 1, rate, rate*2, 2, 16)
+    pad = b"\x00" if len(raw) % 2 else b""   # los chunks RIFF van alineados a 2 bytes
+    body = b"WAVE" + fmt_chunk + struct.pack("<4sI", b"data", len(raw)) + raw + pad
+    return struct.pack("<4sI", b"RIFF", len(body)) + body
+
+def eleven_tts_to_bytes(text: str, retries: int = 0) -> bytes:
     if not ELEVEN_API_KEY:
         return b""
-    r = requests.post(
-        f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVEN_VOICE_ID}",
-        headers={"xi-api-key": ELEVEN_API_KEY, "accept":"audio/mpeg", "content-type":"application/json"},
-        json={"text": text, "model_id":"eleven_multilingual_v2",
-              "voice_settings":{"stability":0.5, "similarity_boost":0.8}},
-        timeout=40
-    )
+    for attempt in range(retries + 1):
+        r = _http().post(
+            f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVEN_VOICE_ID}",
+            params={"output_format": ELEVEN_OUTPUT_FORMAT},
+            headers={"xi-api-key": ELEVEN_API_KEY, "accept": AUDIO_MIME if AUDIO_EXT == "mp3" else "*/*",
+                     "content-type":"application/json"},
+            json={"text": text, "model_id":"eleven_multilingual_v2",
+                  "voice_settings":{"stability":0.5, "similarity_boost":0.8}},
+            timeout=40
+        )
+        # 429 (límite de Eleven): esperamos lo que pida Retry-After y reintentamos
+        if r.status_code == 429 and attempt < retries:
+            try: wait = float(r.headers.get("Retry-After") or 0)
+            except ValueError: wait = 0
+            time.sleep(wait or 2 ** attempt)
+            continue
+        break
     r.raise_for_status()
+    if AUDIO_EXT == "wav" and r.content[:4] != b"RIFF":
+        return _wav_wrap(r.content, ELEVEN_OUTPUT_FORMAT)
     return r.content
 
-def speak(vr: VoiceResponse, text: str, lang: str, base_url: str):
-    # Respuestas cortas y FAST_MODE → <Say> instantáneo
-    short = len(text) <= 140
-    if FAST_MODE and short:
-        vr.say(text, language="es-ES")
-        return
+def store_audio(audio: bytes) -> str:
+    """Guarda el clip por hash de contenido: misma voz → misma URL → cache de Twilio."""
+    aid = hashlib.sha1(audio).hexdigest()
+    AUDIO_STORE[aid] = audio
+    return aid
+
+def _audio_key(text: str, lang: str) -> str:
+    return hashlib.sha1((lang+"|"+text).encode("utf-8")).hexdigest()
+
+def _render_audio(text: str, lang: str, pin: bool = False, retries: int = 0) -> Optional[bytes]:
+    """Traduce si hace falta y sintetiza con Eleven (memo por texto+lang). None si falla.
+    pin=True deja el audio fijo en memo (no caduca con AUDIO_CACHE_TTL)."""
+    # Cache por hash de texto original+lang: un acierto no paga ni traducción ni TTS
+    key = _audio_key(text, lang)
+    now = time.time()
+    memo = _AUDIO_MEMO.get(key)
+    if memo and (memo.get("pinned") or now - memo.get("ts", 0) < AUDIO_CACHE_TTL):
+        if pin: memo["pinned"] = True
+        return memo["bytes"]
+    # Pre-renderizado por otro worker (disco compartido)
+    audio = _prerendered_read(key)
+    if audio:
+        _AUDIO_MEMO[key] = {"ts": now, "bytes": audio, "pinned": True}
+        return audio
 
     # Traducción mínima si fuese necesario
-    speak_text = text
+    speak_text = text; translated = True
     if lang == "en":
         try:
             speak_text = _openai_chat(
                 [{"role":"system","content":"Traduce al inglés con tono conversacional."},
                  {"role":"user","content":text}], temperature=0
-            )
+            ) or text
         except Exception:
-            pass
+            translated = False
     elif lang == "ar":
         try:
             speak_text = _openai_chat(
                 [{"role":"system","content":"Traduce al árabe con tono cercano y claro."},
                  {"role":"user","content":text}], temperature=0
-            )
+            ) or text
         except Exception:
-            pass
-
-    # Cache por hash de texto+lang
-    key = hashlib.sha1((lang+"|"+speak_text).encode("utf-8")).hexdigest()
-    now = time.time()
-    memo = _AUDIO_MEMO.get(key)
-    if memo and now - memo.get("ts", 0) < AUDIO_CACHE_TTL:
-        aid = str(uuid.uuid4()); AUDIO_STORE[aid] = memo["bytes"]
-        vr.play(f"{base_url}/audio/{aid}.mp3")
-        return
+            translated = False
 
     # ElevenLabs
     try:
-        audio = eleven_tts_to_bytes(speak_text)
+        audio = eleven_tts_to_bytes(speak_text, retries=retries)
         if audio:
-            _AUDIO_MEMO[key] = {"ts": now, "bytes": audio}
-            aid = str(uuid.uuid4()); AUDIO_STORE[aid] = audio
-            vr.play(f"{base_url}/audio/{aid}.mp3")
-            return
+            if translated:  # sin traducción no cacheamos audio en español bajo otro idioma
+                _AUDIO_MEMO[key] = {"ts": now, "bytes": audio, "pinned": pin}
+            return audio
     except Exception:
         log.exception("TTS error")
+    return None
+
+def _uses_say(text: str) -> bool:
+    # Respuestas cortas y FAST_MODE → <Say> instantáneo
+    return FAST_MODE and len(text) <= 140
+
+def speak(vr: VoiceResponse, text: str, lang: str, base_url: str,
+          audio: Optional[bytes] = None) -> Optional[bytes]:
+    """Añade el audio a vr. Devuelve los bytes reproducidos (None si fue <Say>)."""
+    if _uses_say(text):
+        vr.say(text, language="es-ES")
+        return None
+
+    audio = audio or _render_audio(text, lang)
+    if audio:
+        aid = store_audio(audio)
+        vr.play(f"{base_url}/audio/{aid}.{AUDIO_EXT}")
+        return audio
 
     # Fallback Twilio <Say>
     vr.say(text, language="es-ES")
+    return None
+
+# ------------- Cache de respuestas sin herramientas (FAQ) -------------
+# Preguntas genéricas ("¿cómo funciona la visita?") → misma respuesta: ni OpenAI ni TTS.
+_ANSWER_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # {clave: {"ts","text","audio"}}
+_ANSWER_LOCK = threading.Lock()
+
+def _answer_key(text: str, lang: str, board_id: int) -> str:
+    return f"{lang}|{board_id}|{' '.join(_norm(text).split())}"
+
+def _mentions_number(text: str, phone: str) -> bool:
+    """¿La respuesta lleva el teléfono del caller? (por sus últimos 9 dígitos, con o sin prefijo)"""
+    tail = _digits(phone)[-9:]
+    return len(tail) >= 6 and tail in _digits(text)
+
+def answer_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    with _ANSWER_LOCK:
+        e = _ANSWER_CACHE.get(key)
+        if not e: return None
+        if time.time() - e["ts"] > ANSWER_CACHE_TTL:
+            _ANSWER_CACHE.pop(key, None); return None
+        _ANSWER_CACHE.move_to_end(key)
+        return e
+
+def answer_cache_put(key: str, text: str, audio: Optional[bytes]):
+    with _ANSWER_LOCK:
+        _ANSWER_CACHE[key] = {"ts": time.time(), "text": text, "audio": audio}
+        _ANSWER_CACHE.move_to_end(key)
+        while len(_ANSWER_CACHE) > ANSWER_CACHE_MAX:
+            _ANSWER_CACHE.popitem(last=False)
 
 # ------------- Monday helpers -------------
+# Token bucket de complejidad (compartido por todos los hilos) + circuit breaker.
+# Las lecturas en vivo pueden gastar todo el bucket; el trabajo de fondo (refrescos,
+# pre-render, precarga) deja libre MONDAY_BG_RESERVE para no pisar a quien está llamando.
+class MondayUnavailable(RuntimeError):
+    """Monday no disponible ahora: circuito abierto o sin presupuesto de complejidad."""
+
+_MB = {"level": float(MONDAY_BUDGET_PER_MIN), "ts": time.time(), "blocked_until": 0.0}
+_MB_COND = threading.Condition()
+_MONDAY_COST: Dict[str, int] = {}      # {hash(query): última complejidad real}
+MONDAY_DEFAULT_COST = 20000
+_CB = {"fails": 0, "open_until": 0.0, "trial": False}
+_CB_LOCK = threading.Lock()
+_MONDAY_CTX = threading.local()
+
+@contextlib.contextmanager
+def monday_background():
+    """Las llamadas a Monday dentro del bloque van con prioridad de fondo."""
+    prev = getattr(_MONDAY_CTX, "background", False)
+    _MONDAY_CTX.background = True
+    try: yield
+    finally: _MONDAY_CTX.background = prev
+
+def in_background(fn, *args, **kwargs):
+    with monday_background():
+        return fn(*args, **kwargs)
+
+def _budget_acquire(cost: int, background: bool) -> bool:
+    cap = float(MONDAY_BUDGET_PER_MIN)
+    cost = min(cost, cap)
+    floor = cap * MONDAY_BG_RESERVE if background else 0.0
+    deadline = time.time() + (60.0 if background else 5.0)
+    with _MB_COND:
+        while True:
+            now = time.time()
+            _MB["level"] = min(cap, _MB["level"] + (now - _MB["ts"]) * cap / 60.0); _MB["ts"] = now
+            if now >= _MB["blocked_until"] and _MB["level"] - cost >= floor:
+                _MB["level"] -= cost
+                return True
+            if now >= deadline:
+                return False
+            need = max(_MB["blocked_until"] - now, (cost + floor - _MB["level"]) * 60.0 / cap)
+            _MB_COND.wait(min(deadline - now, max(need, 0.05), 1.0))
+
+def _budget_sync(after: Optional[float], reset_in: Optional[float]):
+    # La cuenta es de Monday (compartida entre workers): su 'after' manda sobre nuestro bucket
+    with _MB_COND:
+        if after is not None:
+            _MB["level"] = min(_MB["level"], float(after))
+        if reset_in and _MB["level"] <= 0:
+            _MB["blocked_until"] = max(_MB["blocked_until"], time.time() + float(reset_in))
+        _MB_COND.notify_all()
+
+def _cb_allow() -> Tuple[bool, bool]:
+    """(se permite la llamada, es la prueba del estado medio abierto)."""
+    with _CB_LOCK:
+        if _CB["fails"] < MONDAY_CB_FAILS: return True, False
+        if time.time() < _CB["open_until"] or _CB["trial"]: return False, False
+        _CB["trial"] = True     # medio abierto: dejamos pasar una sola prueba
+        return True, True
+
+def _cb_release_trial():
+    # La prueba no llegó a Monday (p.ej. sin presupuesto): otra llamada podrá intentarlo
+    with _CB_LOCK:
+        _CB["trial"] = False
+
+def _cb_record(ok: bool):
+    with _CB_LOCK:
+        was_open = _CB["fails"] >= MONDAY_CB_FAILS
+        _CB["trial"] = False
+        if ok:
+            if was_open: log.warning("Monday: circuito cerrado")
+            _CB["fails"] = 0
+            return
+        _CB["fails"] += 1
+        if _CB["fails"] >= MONDAY_CB_FAILS:
+            _CB["open_until"] = time.time() + MONDAY_CB_COOLDOWN
+            log.warning("Monday: circuito abierto %ss tras %s fallos", MONDAY_CB_COOLDOWN, _CB["fails"])
+
+def _rate_limit_reset(errors: Any) -> Optional[float]:
+    """Segundos de espera si el error es de complejidad/rate limit; None si es otro error."""
+    txt = json.dumps(errors, ensure_ascii=False)
+    if not re.search(r"complexity|rate.?limit|budget", txt, re.I): return None
+    m = re.search(r"reset in (\d+) seconds?", txt) or re.search(r'"retry_in_seconds":\s*(\d+)', txt)
+    return float(m.group(1)) if m else 30.0
+
 def monday_query(query: str, variables: Optional[Dict[str, Any]]=None) -> Dict[str, Any]:
     if not MONDAY_API_KEY: raise RuntimeError("Falta MONDAY_API_KEY (o monday_api)")
-    r = requests.post(MONDAY_API_URL,
-                      headers={"Authorization": MONDAY_API_KEY, "Content-Type":"application/json"},
-                      json={"query": query, "variables": variables or {}},
-                      timeout=40)
-    r.raise_for_status()
-    data = r.json()
-    if "errors" in data:
-        raise RuntimeError(str(data["errors"]))
-    return data["data"]
+    allowed, trial = _cb_allow()
+    if not allowed:
+        raise MondayUnavailable("Monday: circuito abierto")
+    qkey = hashlib.sha1(query.encode("utf-8")).hexdigest()
+    try:
+        acquired = _budget_acquire(_MONDAY_COST.get(qkey, MONDAY_DEFAULT_COST), getattr(_MONDAY_CTX, "background", False))
+    except BaseException:
+        if trial: _cb_release_trial()
+        raise
+    if not acquired:
+        if trial: _cb_release_trial()
+        raise MondayUnavailable("Monday: sin presupuesto de complejidad")
+    # Pedimos también la complejidad real para aprender el coste y sincronizar el bucket
+    q = re.sub(r"^(\s*(?:query|mutation)\b[^{]*\{)", r"\1 complexity{ query after reset_in_x_seconds } ", query, count=1)
+    try:
+        r = _http().post(MONDAY_API_URL,
+                          headers={"Authorization": MONDAY_API_KEY, "Content-Type":"application/json"},
+                          json={"query": q, "variables": variables or {}},
+                          timeout=40)
+        if r.status_code == 429:
+            _budget_sync(0, float(r.headers.get("Retry-After") or 30))
+            raise MondayUnavailable("Monday: 429 rate limit")
+        r.raise_for_status()
+        data = r.json()
+    except Exception:
+        _cb_record(False)
+        raise
+    errors = data.get("errors") or (data.get("error_code") and [data])
+    if errors:
+        reset_in = _rate_limit_reset(errors)
+        if reset_in is not None:
+            _budget_sync(0, reset_in); _cb_record(False)
+            raise MondayUnavailable(str(errors))
+        _cb_record(True)    # error de la consulta, no de Monday
+        raise RuntimeError(str(errors))
+    _cb_record(True)
+    out = data.get("data") or {}
+    cx = out.pop("complexity", None) or {}
+    if cx.get("query"): _MONDAY_COST[qkey] = int(cx["query"])
+    _budget_sync(cx.get("after"), cx.get("reset_in_x_seconds"))
+    return out
 
 def monday_get_item(item_id: int) -> Dict[str, Any]:
     q = """query($id:[ID!]){ items(ids:$id){ id name column_values{ id text value } } }"""
-    d = monday_query(q, {"id":[item_id]})
+    try:
+        d = monday_query(q, {"id":[item_id]})
+    except MondayUnavailable:
+        # Caída/limite de Monday: el item del último snapshot (solo 'text') sirve para hablar
+        for snap in list(_BOARD_CACHE.values()):
+            for it in snap.get("items") or []:
+                if str(it.get("id")) == str(item_id):
+                    return it
+        raise
     arr = d.get("items") or []
     return arr[0] if arr else {}
 
@@ -504,13 +928,27 @@ def _price(s: str) -> Optional[float]:
     try: return float("".join(nums))
     except: return None
 
-def board_items_page(board_id: int, limit: int = 300) -> List[Dict[str, Any]]:
+def board_items_page(board_id: int, limit: int = 300, force: bool = False) -> List[Dict[str, Any]]:
     # cache
     now = time.time()
     cached = _BOARD_CACHE.get(board_id)
-    if cached and now - cached.get("ts", 0) < BOARD_CACHE_TTL:
+    if not force and cached and now - cached.get("ts", 0) < BOARD_CACHE_TTL:
         return cached.get("items", [])
 
+    try:
+        items = _fetch_board_items(board_id, limit)
+    except Exception:
+        # Monday en apuros → último snapshot bueno (aunque esté caducado) mientras dure
+        if cached:
+            log.warning("board_items_page board=%s: Monday no responde, sirvo snapshot de hace %ds",
+                        board_id, int(now - cached.get("ts", now)))
+            return cached.get("items", [])
+        raise
+
+    _BOARD_CACHE[board_id] = {"ts": now, "items": items}
+    return items
+
+def _fetch_board_items(board_id: int, limit: int) -> List[Dict[str, Any]]:
     items=[]; cursor=None; remaining=limit
     while remaining>0:
         chunk=min(50, remaining)
@@ -533,8 +971,6 @@ def board_items_page(board_id: int, limit: int = 300) -> List[Dict[str, Any]]:
         cursor = page.get("cursor")
         if not cursor: break
         remaining -= chunk
-
-    _BOARD_CACHE[board_id] = {"ts": now, "items": items}
     return items
 
 def extract_nolon_candidate(text: str) -> Optional[str]:
@@ -598,20 +1034,23 @@ def find_by_city(items, m, city) -> List[Dict[str, Any]]:
             out.append(it)
     return out
 
-def search_flexible(board_id:int, text:str)->Optional[Dict[str,Any]]:
+SCORE_MAX = 7.5   # máximo teórico de score_item → normaliza a 0..1
+
+def _search_scored(board_id:int, text:str)->Optional[Tuple[Dict[str,Any], float]]:
+    """Como search_flexible pero con score normalizado 0..1 (comparable entre boards)."""
     if not text: return None
     ref = extract_nolon_candidate(text)
-    log.info("search_flexible: ref=%s", ref)
+    log.info("search_flexible: board=%s ref=%s", board_id, ref)
 
     # NOLON numérico → columna NOLON
     if ref and ref.isdigit():
         it = find_by_nolon(board_id, ref)
-        if it: return it
+        if it: return it, 1.0
 
     # Código tipo CG... → nombre exacto
     if ref and not ref.isdigit():
         it = find_by_code(board_id, ref)
-        if it: return it
+        if it: return it, 1.0
 
     # Filtro rápido por ciudad si la frase es corta
     m = BOARD_MAP.get(board_id, BOARD_MAP[MONDAY_DEFAULT_BOARD_ID])
@@ -623,7 +1062,7 @@ def search_flexible(board_id:int, text:str)->Optional[Dict[str,Any]]:
     if city:
         lst = find_by_city(items, m, city)
         if lst:
-            return lst[0]
+            return lst[0], 0.5
 
     # Score por dirección/nombre/población + precio
     budget = _price(text)
@@ -633,17 +1072,67 @@ def search_flexible(board_id:int, text:str)->Optional[Dict[str,Any]]:
         sc = score_item(it, m, address, budget)
         if sc > best_sc:
             best_sc, best = sc, it
-    return best if (best and best_sc >= 1.0) else None
+    return (best, min(best_sc / SCORE_MAX, 1.0)) if (best and best_sc >= 1.0) else None
+
+def search_flexible(board_id:int, text:str)->Optional[Dict[str,Any]]:
+    hit = _search_scored(board_id, text)
+    return hit[0] if hit else None
+
+# ------------- Búsqueda federada (todos los boards de BOARD_MAP) -------------
+# El board preferido se busca en el hilo de la petición; el resto va al pool. Con un hueco
+# por (hilo de petición × board extra) ninguna búsqueda hace cola detrás de otro caller.
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=max(2, WEB_THREADS * max(1, len(BOARD_MAP) - 1)),
+                                  thread_name_prefix="search")
+
+def search_federated(text:str, prefer_board:int=MONDAY_DEFAULT_BOARD_ID)->Optional[Tuple[int, Dict[str,Any]]]:
+    """Busca en paralelo en cada board y devuelve (board_id, item) con mejor score.
+    Latencia ≈ la del board más lento; a igualdad gana prefer_board."""
+    if not text: return None
+    if prefer_board not in BOARD_MAP: prefer_board = MONDAY_DEFAULT_BOARD_ID
+    futs = {bid: _SEARCH_POOL.submit(_search_scored, bid, text) for bid in BOARD_MAP if bid != prefer_board}
+    try:
+        local = _search_scored(prefer_board, text)
+    except Exception:
+        log.exception("search_federated board=%s", prefer_board); local = None
+    best: Optional[Tuple[int, Dict[str,Any]]] = (prefer_board, local[0]) if local else None
+    best_sc = local[1] if local else -1.0
+    for bid, fut in futs.items():
+        try:
+            hit = fut.result(timeout=45)
+        except Exception:
+            log.exception("search_federated board=%s", bid)
+            continue
+        if not hit: continue
+        it, sc = hit
+        if sc > best_sc:
+            best, best_sc = (bid, it), sc
+    return best
+
+def find_property(board_id:int, text:str)->Optional[Tuple[int, Dict[str,Any]]]:
+    """(board_id, item) según el modo: federado (SEARCH_FEDERATED) o solo el board pedido."""
+    if SEARCH_FEDERATED:
+        return search_federated(text, board_id)
+    it = search_flexible(board_id, text)
+    return (board_id, it) if it else None
+
+def _warm_boards_loop():
+    # Refresca los snapshots antes de que caduquen para que ninguna búsqueda pague Monday
+    every = max(5, int(BOARD_CACHE_TTL * 0.8))
+    while True:
+        for bid in BOARD_MAP:
+            try: in_background(board_items_page, bid, 300, force=True)
+            except Exception: log.exception("warm_board %s", bid)
+        time.sleep(every)
 
 # ------------- WhatsApp -------------
 def _twilio_params_wa(to_e164: str) -> Dict[str, Any]:
-    if _twilio is None: raise RuntimeError("Twilio no está configurado")
+    if _twilio_client() is None: raise RuntimeError("Twilio no está configurado")
     return {"to": f"whatsapp:{to_e164}", "from_": f"whatsapp:{TWILIO_PHONE_E164}"}
 
 def wa_text(to_e164: str, text: str):
     try:
         p = _twilio_params_wa(to_e164); p["body"]=text
-        _twilio.messages.create(**p)
+        _twilio_client().messages.create(**p)
     except Exception:
         log.exception("wa_text")
 
@@ -651,10 +1140,25 @@ def wa_images(to_e164: str, urls: List[str]):
     for u in urls[:3]:
         try:
             p = _twilio_params_wa(to_e164); p["media_url"]=[u]
-            _twilio.messages.create(**p)
+            _twilio_client().messages.create(**p)
         except Exception:
             log.exception("wa_images")
 
+def send_brief(to_e164: str, item: Dict[str, Any], board_id: int, pre: Optional[Dict[str, Any]] = None):
+    """Ficha + imágenes por WhatsApp; reutiliza lo precargado si lo hay."""
+    pre = pre or {}
+    resumen = (pre.get("summary") or {}).get("es") or say_summary(item, board_id, "es")
+    wa_text(to_e164, "Ficha y visita:\n\n"+resumen)
+    try:
+        imgs = pre["images"] if "images" in pre else extract_images(item, board_id)
+    except MondayUnavailable:
+        imgs = []   # la ficha en texto sale igual
+    if imgs: wa_images(to_e164, imgs)
+
+def send_brief_once(to_e164: str, item: Dict[str, Any], board_id: int, pre: Optional[Dict[str, Any]] = None):
+    # Mismo teléfono + inmueble en pocos minutos (reintento, tool y vía rápida) → un solo envío
+    claim_once(f"wa|{to_e164}|{item.get('id')}", lambda: send_brief(to_e164, item, board_id, pre), ttl=300)
+
 # ------------- Subitems (crear visita) -------------
 def sub_cols_reos() -> Dict[str, Optional[str]]:
     return {
@@ -666,6 +1170,19 @@ def sub_cols_reos() -> Dict[str, Optional[str]]:
         "status": SUB_REOS_STATUS_COL_ID,
     }
 
+def sub_cols_ces() -> Dict[str, Optional[str]]:
+    return {
+        "name":   SUB_CES_NAME_COL_ID,
+        "phone":  SUB_CES_PHONE_COL_ID,
+        "email":  SUB_CES_EMAIL_COL_ID,
+        "date":   SUB_CES_DATE_COL_ID,
+        "nolon":  SUB_CES_NOLON_COL_ID,
+        "status": SUB_CES_STATUS_COL_ID,
+    }
+
+def sub_cols(board_id: int) -> Dict[str, Optional[str]]:
+    return sub_cols_ces() if board_id == 2068339939 else sub_cols_reos()
+
 def create_subitem_contact(parent_item_id:int, board_id:int,
                            title:str, name:str, phone:str, email:str,
                            date_iso:Optional[str], nolon_text:Optional[str]) -> Optional[int]:
@@ -678,7 +1195,7 @@ def create_subitem_contact(parent_item_id:int, board_id:int,
     except Exception:
         return None
 
-    cols = sub_cols_reos()
+    cols = sub_cols(board_id)
     payload={}
     if cols.get("name") and name:   payload[cols["name"]]  = name
     if cols.get("phone") and phone: payload[cols["phone"]] = phone
@@ -713,6 +1230,237 @@ def say_summary(item: Dict[str,Any], board_id:int, lang:str) -> str:
         return f"{nombre}. Address: {dir_}. City: {pob}. Price: {precio}. Visit day: {fecha}."
     return f"{nombre}. Dirección: {dir_}. Población: {pob}. Precio: {precio}. Día de visita: {fecha}."
 
+def say_wa_sent(lang: str) -> str:
+    if lang=="ar": return "تمام، أرسلت لك الملف على واتساب. هل أحجز لك الزيارة؟"
+    if lang=="en": return "Done, I've just sent you the listing on WhatsApp. Shall I book you in for the visit?"
+    return "Listo, te acabo de enviar la ficha por WhatsApp. ¿Te apunto para la visita?"
+
+def say_book_ask(lang: str) -> str:
+    if lang=="ar": return "ممتاز. باسم من أسجل الزيارة؟"
+    if lang=="en": return "Great. Whose name should I put the visit under?"
+    return "Perfecto. ¿A nombre de quién hago la reserva?"
+
+# ------------- Precarga especulativa -------------
+# En cuanto /gather identifica un inmueble, lo más probable es "mándamelo" o "apúntame".
+# Adelantamos en segundo plano lo que necesitan esos turnos (item completo, imágenes,
+# resúmenes y audios de confirmación) y lo guardamos en la sesión con TTL corto.
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+_WA_INTENT   = re.compile(r"\b(m[aá]nd|env[ií]a|whats|guasap|wasap|send)", re.I)
+_BOOK_INTENT = re.compile(r"\b(ap[uú]nt|reserv|book)", re.I)
+# Atajo solo ante un "sí" claro: cualquier negación/aplazamiento u otro canal → decide el LLM
+_NEG_INTENT  = re.compile(r"\b(no|ni|nunca|todav[ií]a|a[uú]n|luego|despu[eé]s|not|don'?t|later)\b|(?<!\S)لا(?!\S)", re.I)
+_OTHER_CHANNEL = re.compile(r"\b(correo|e-?mail|mail|sms|mensaje de texto)\b", re.I)
+
+# Palabras que acompañan a "mándamelo"/"apúntame" sin nombrar otro inmueble
+_INTENT_FILLER = {
+    "sí", "si", "vale", "ok", "okay", "claro", "venga", "perfecto", "genial", "bueno", "pues", "ya",
+    "porfa", "por", "favor", "gracias", "ahora", "mismo", "me", "te", "mí", "mi", "lo", "la", "los",
+    "las", "eso", "esa", "ese", "esto", "ficha", "info", "información", "para", "a", "al", "en",
+    "visita", "cita", "yes", "please", "it", "the", "listing", "visit", "for", "now",
+}
+
+def _clear_intent(intent: "re.Pattern[str]", speech: str, exclude: Optional["re.Pattern[str]"] = None) -> bool:
+    """Un "sí" claro sobre el inmueble EN CURSO: verbo de la intención, sin negación ni otro
+    canal, y nada más que pronombres/muletillas. Si nombra un inmueble ("mándame el 597444",
+    "el de Madrid") no es un seguimiento: decide la vía rápida o el LLM."""
+    if not intent.search(speech) or _NEG_INTENT.search(speech):
+        return False
+    if exclude and exclude.search(speech):
+        return False
+    if extract_nolon_candidate(speech):
+        return False
+    rest = [t for t in _norm(speech).split() if t not in _INTENT_FILLER and not intent.search(t)]
+    return not rest
+
+def _prefetch_job(pf: Dict[str, Any]):
+    with monday_background():
+        _prefetch_run(pf)
+
+def _prefetch_run(pf: Dict[str, Any]):
+    cancel: threading.Event = pf["cancel"]
+    item_id, board_id, lang = pf["item_id"], pf["board_id"], pf["lang"]
+    data: Dict[str, Any] = {}
+    try:
+        it = monday_get_item(item_id)
+        if not it or cancel.is_set(): return
+        data["item"] = it
+        data["summary"] = {l: say_summary(it, board_id, l) for l in {"es", lang}}
+        pf["data"] = data
+        data["images"] = extract_images(it, board_id)
+        for text in (say_wa_sent(lang), say_book_ask(lang)):
+            if cancel.is_set(): return
+            if not _uses_say(text): _render_audio(text, lang)
+    except Exception:
+        log.exception("prefetch %s", item_id)
+
+def prefetch_start(st: Dict[str, Any], item_id: int, board_id: int, lang: str):
+    pf = st.get("prefetch")
+    if pf and pf["item_id"] == item_id and pf["lang"] == lang and time.time() - pf["ts"] < PREFETCH_TTL:
+        return
+    prefetch_cancel(st)
+    pf = {"item_id": item_id, "board_id": board_id, "lang": lang, "ts": time.time(),
+          "cancel": threading.Event(), "data": None}
+    pf["future"] = _PREFETCH_POOL.submit(_prefetch_job, pf)
+    st["prefetch"] = pf
+
+def prefetch_cancel(st: Dict[str, Any]):
+    pf = st.pop("prefetch", None)
+    if pf:
+        pf["cancel"].set()
+        pf["future"].cancel()
+
+def prefetched(st: Optional[Dict[str, Any]], item_id: int, wait: float = 0.0) -> Dict[str, Any]:
+    """Datos precargados para item_id (vacío si no hay, caducó o es de otro inmueble)."""
+    pf = (st or {}).get("prefetch")
+    if not pf or pf["item_id"] != item_id or time.time() - pf["ts"] > PREFETCH_TTL:
+        return {}
+    if wait > 0 and not pf["future"].done():
+        try: pf["future"].result(timeout=wait)
+        except Exception: pass
+    return pf.get("data") or {}
+
+# ------------- Pre-render de resúmenes (audio) -------------
+# Recorre el snapshot del board y deja el say_summary de cada item/idioma en disco
+# (PRERENDER_DIR/<board>/<clave>.<ext>), compartido por todos los workers, y fijado en
+# _AUDIO_MEMO. Solo se re-sintetiza lo que cambió. El refresco periódico lo hace un único
+# worker (el que gana el flock de .leader); el master carga lo que hay en disco antes del
+# fork (load_prerendered) y los workers lo heredan copy-on-write.
+_PRERENDERED: Dict[tuple, tuple] = {}   # {(board_id, item_id, lang): (hash campos, clave audio)}
+_PRERENDER_LOCK = threading.Lock()
+_LEADER_FD: Optional[int] = None
+
+def _prerender_path(board_id: int, key: str) -> str:
+    return os.path.join(PRERENDER_DIR, str(board_id), f"{key}.{AUDIO_EXT}")
+
+def _prerendered_read(key: str) -> Optional[bytes]:
+    for bid in BOARD_MAP:
+        try:
+            with open(_prerender_path(bid, key), "rb") as f: return f.read()
+        except OSError:
+            continue
+    return None
+
+def _prerendered_write(board_id: int, key: str, audio: bytes):
+    path = _prerender_path(board_id, key)
+    if os.path.exists(path): return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f: f.write(audio)
+        os.replace(tmp, path)   # atómico: otro worker nunca lee un fichero a medias
+    except OSError:
+        log.exception("prerender write %s", path)
+
+def _prerendered_drop(board_id: int, key: str):
+    _AUDIO_MEMO.pop(key, None)
+    try: os.remove(_prerender_path(board_id, key))
+    except OSError: pass
+
+def load_prerendered() -> int:
+    """Sube a _AUDIO_MEMO (fijado) todo lo pre-renderizado en disco. Pensado para el master."""
+    n = 0
+    for bid in BOARD_MAP:
+        d = os.path.join(PRERENDER_DIR, str(bid))
+        for fn in (os.listdir(d) if os.path.isdir(d) else []):
+            key, _, ext = fn.partition(".")
+            if ext != AUDIO_EXT: continue
+            audio = _prerendered_read(key)
+            if audio:
+                _AUDIO_MEMO[key] = {"ts": time.time(), "bytes": audio, "pinned": True}; n += 1
+    return n
+
+def prerender_leader() -> bool:
+    """True solo en un proceso a la vez (flock no bloqueante; se libera si el worker muere)."""
+    global _LEADER_FD
+    if _LEADER_FD is not None: return True
+    fd = None
+    try:
+        os.makedirs(PRERENDER_DIR, exist_ok=True)
+        fd = os.open(os.path.join(PRERENDER_DIR, ".leader"), os.O_CREAT | os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        if fd is not None: os.close(fd)
+        return False
+    _LEADER_FD = fd
+    return True
+
+def _summary_fields_hash(item: Dict[str, Any], board_id: int) -> str:
+    m = BOARD_MAP.get(board_id, BOARD_MAP[MONDAY_DEFAULT_BOARD_ID])
+    fields = [item.get("name"), _get_text(item, m["direccion"]), _get_text(item, m["poblacion"]),
+              _get_text(item, m["precio_main"]), _get_text(item, m["precio_alt"]),
+              _get_date(item, m["fecha_visita"])]
+    return hashlib.sha1(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _prerender_one(board_id: int, item: Dict[str, Any], lang: str) -> str:
+    try:
+        k = (board_id, int(item["id"]), lang)
+        h = _summary_fields_hash(item, board_id)
+        prev = _PRERENDERED.get(k)
+        if prev and prev[0] == h and os.path.exists(_prerender_path(board_id, prev[1])):
+            return "skip"
+        text = say_summary(item, board_id, lang)
+        if _uses_say(text): return "skip"
+        # Si ya está en memo o en disco (p.ej. tras reiniciar) no se vuelve a sintetizar
+        audio = _render_audio(text, lang, pin=True, retries=3)
+        if not audio:
+            return "fail"
+        key = _audio_key(text, lang)
+        _prerendered_write(board_id, key, audio)
+        if prev and prev[1] != key:
+            _prerendered_drop(board_id, prev[1])
+        _PRERENDERED[k] = (h, key)
+        return "ok"
+    except Exception:
+        log.exception("prerender %s", item.get("id"))
+        return "fail"
+
+def prerender_summaries(board_id: int, langs: Optional[List[str]] = None) -> Dict[str, int]:
+    """Sintetiza (pool acotado) los resúmenes de todo el board. Devuelve contadores."""
+    if not _PRERENDER_LOCK.acquire(blocking=False):
+        return {"busy": 1}
+    try:
+        t0 = time.time()
+        langs = langs or PRERENDER_LANGS
+        items = in_background(board_items_page, board_id, 300)
+        stats = {"ok": 0, "skip": 0, "fail": 0}
+        with ThreadPoolExecutor(max_workers=PRERENDER_WORKERS, thread_name_prefix="prerender") as pool:
+            jobs = [(it, l) for it in items for l in langs]
+            for res in pool.map(lambda a: _prerender_one(board_id, *a), jobs):
+                stats[res] += 1
+        # Propiedades que ya no están en el board (o audios huérfanos en disco) → liberar
+        ids = {int(it["id"]) for it in items}
+        for k, (_, key) in list(_PRERENDERED.items()):
+            if k[0] == board_id and k[1] not in ids:
+                _PRERENDERED.pop(k, None); _prerendered_drop(board_id, key)
+        live = {key for k, (_, key) in _PRERENDERED.items() if k[0] == board_id}
+        d = os.path.join(PRERENDER_DIR, str(board_id))
+        for fn in (os.listdir(d) if os.path.isdir(d) else []):
+            key, _, ext = fn.partition(".")
+            if ext == AUDIO_EXT and key not in live:
+                _prerendered_drop(board_id, key)
+        log.info("prerender board=%s %s en %.1fs", board_id, stats, time.time() - t0)
+        return stats
+    finally:
+        _PRERENDER_LOCK.release()
+
+def _calls_live(window: int = 30) -> bool:
+    now = time.time()
+    return any(now - (v.get("ts") or 0) < window for v in list(SESS.values()))
+
+def _prerender_loop():
+    # Primera pasada nada más arrancar (sin llamadas aún); luego cada PRERENDER_INTERVAL
+    while True:
+        try:
+            prerender_summaries(MONDAY_DEFAULT_BOARD_ID)
+        except Exception:
+            log.exception("prerender_loop")
+        time.sleep(PRERENDER_INTERVAL)
+        # Solo en ratos muertos: si hay llamadas vivas, esperamos (como mucho otro intervalo)
+        waited = 0
+        while _calls_live() and waited < PRERENDER_INTERVAL:
+            time.sleep(5); waited += 5
+
 # ------------- Flask helpers -------------
 def ok_json(data: Any, code: int = 200):
     return Response(json.dumps(data, ensure_ascii=False), status=code, mimetype="application/json")
@@ -738,13 +1486,18 @@ def _new_gather():
 
 # ------------- Rutas -------------
 @app.get("/healthz")
-def health(): return ok_json({"ok": True})
+def health(): return ok_json({"ok": True, **_READY})
 
-@app.get("/audio/<aid>.mp3")
-def audio(aid: str):
+@app.get("/audio/<aid>.<ext>")
+def audio(aid: str, ext: str):
     data = AUDIO_STORE.get(aid)
-    if not data: abort(404)
-    return send_file(io.BytesIO(data), mimetype="audio/mpeg", download_name=f"{aid}.mp3")
+    if not data or ext != AUDIO_EXT: abort(404)
+    # aid = sha1 del contenido → ETag fuerte y cache inmutable; send_file resuelve
+    # If-None-Match (304) y Range (206) por nosotros.
+    rv = send_file(io.BytesIO(data), mimetype=AUDIO_MIME, download_name=f"{aid}.{ext}",
+                   etag=aid, conditional=True, max_age=31536000)
+    rv.cache_control.immutable = True
+    return rv
 
 WELCOME = "Hola, gracias por llamar a Lifeway. ¿En qué puedo ayudarte?"
 
@@ -757,6 +1510,19 @@ def voice_in():
 
 @app.post("/gather")
 def gather():
+    call_sid = request.values.get("CallSid")
+    if not call_sid:
+        return _gather_turn()
+    # Twilio manda el mismo I-Twilio-Idempotency-Token en los reintentos; sin él, la misma
+    # frase en la misma llamada solo cuenta como reintento durante unos segundos.
+    token = request.headers.get("I-Twilio-Idempotency-Token")
+    turn = token or hashlib.sha1("|".join(request.values.get(k) or "" for k in
+                                 ("SpeechResult", "Confidence")).encode("utf-8")).hexdigest()
+    run = lambda: _gather_turn().get_data(as_text=True)
+    twiml = idempotent(f"turn|{call_sid}|{turn}", run, ttl=IDEM_TTL if token else 20, on_busy=run)
+    return Response(twiml, mimetype="application/xml")
+
+def _gather_turn() -> Response:
     vr = VoiceResponse(); base = request.url_root.rstrip("/")
     call_sid = request.values.get("CallSid") or str(uuid.uuid4())
     st = _sess(call_sid)
@@ -773,22 +1539,55 @@ def gather():
         lang = "ar" if re.search(r"[\u0600-\u06FF]", speech) else (st.get("lang") or "es")
         st["lang"] = lang
 
+        # ---------- SEGUIMIENTO DEL INMUEBLE EN CURSO (precargado) ----------
+        last_id = st.get("last_item_id")
+        if last_id and len(speech.split()) <= 6:
+            if from_num.startswith("+") and _clear_intent(_WA_INTENT, speech, _OTHER_CHANNEL):
+                pre = prefetched(st, last_id, wait=2.0)
+                it = pre.get("item") or monday_get_item(last_id)
+                if it:
+                    send_brief_once(from_num, it, st.get("last_board_id", board_id), pre)
+                    speak(vr, say_wa_sent(lang), lang, base)
+                    vr.append(_new_gather()); return Response(str(vr), mimetype="application/xml")
+            if _clear_intent(_BOOK_INTENT, speech):
+                reply = say_book_ask(lang)
+                st["history"] += [
+                    {"role":"system","content":f"Propiedad en curso: item_id={last_id}, board_id={st.get('last_board_id', board_id)}"},
+                    {"role":"user","content":speech},
+                    {"role":"assistant","content":reply},
+                ]
+                speak(vr, reply, lang, base)
+                vr.append(_new_gather()); return Response(str(vr), mimetype="application/xml")
+
         # ---------- VIA RÁPIDA (SIN LLM) ----------
         quick_ref = extract_nolon_candidate(speech)
         short_hint = len(speech.split()) <= 7  # frases cortas con ciudad/calle/precio
 
         if quick_ref or short_hint:
-            it = search_flexible(board_id, speech)
-            if it:
+            hit = find_property(board_id, speech)
+            if hit:
+                board_id, it = hit
                 resumen = say_summary(it, board_id, lang)
-                st["last_item_id"] = int(it["id"])
-                extra = ""
+                st["last_item_id"] = int(it["id"]); st["last_board_id"] = board_id
+                prefetch_start(st, int(it["id"]), board_id, lang)
+                # Resumen y oferta van en clips separados: el resumen sale pre-renderizado
+                speak(vr, resumen, lang, base)
                 if from_num.startswith("+"):
-                    extra = " Si quieres, te envío la ficha por WhatsApp ahora mismo. ¿Te apunto para la visita?"
-                speak(vr, resumen + ". " + extra, lang, base)
+                    speak(vr, "Si quieres, te envío la ficha por WhatsApp ahora mismo. ¿Te apunto para la visita?", lang, base)
                 vr.append(_new_gather()); return Response(str(vr), mimetype="application/xml")
 
         # ---------- AGENTE (LLM + tools) ----------
+        # La cache de FAQ solo vale sin contexto de conversación: sin inmueble en curso ni
+        # turnos previos ("sí" o "¿y a qué hora?" dependen de lo hablado con ESTE caller)
+        fresh = not st.get("last_item_id") and not any(
+            h.get("role") in ("user", "assistant") for h in st["history"])
+        akey = _answer_key(speech, lang, board_id)
+        cached = answer_cache_get(akey) if fresh else None
+        if cached:
+            st["history"] += [{"role":"user","content":speech}, {"role":"assistant","content":cached["text"]}]
+            speak(vr, cached["text"], lang, base, audio=cached["audio"])
+            vr.append(_new_gather()); return Response(str(vr), mimetype="application/xml")
+
         info = nlu_extract(speech)
         if info.get("lang"):
             st["lang"] = info["lang"]; lang = info["lang"]
@@ -798,10 +1597,14 @@ def gather():
         if from_num.startswith("+"):
             st["history"].append({"role":"system","content":f"Teléfono que llama: {from_num}"})
 
-        agent_reply = reason_and_act(st["history"], call_sid, lang, board_id)
+        meta: Dict[str, Any] = {}
+        agent_reply = reason_and_act(st["history"], call_sid, lang, board_id, meta)
         st["history"].append({"role":"assistant","content":agent_reply})
 
-        speak(vr, agent_reply, lang, base)
+        audio = speak(vr, agent_reply, lang, base)
+        if (fresh and not meta.get("tools") and akey == _answer_key(speech, lang, board_id)  # mismo idioma tras NLU
+                and not _mentions_number(agent_reply, from_num)):
+            answer_cache_put(akey, agent_reply, audio)
         vr.append(_new_gather())
         return Response(str(vr), mimetype="application/xml")
 
@@ -810,6 +1613,14 @@ def gather():
         speak(vr, "Se me fue un cable, pero ya está. ¿Me repites por favor?", st.get("lang","es"), base)
         vr.append(_new_gather()); return Response(str(vr), mimetype="application/xml")
 
+# Estado de la llamada (statusCallback de Twilio): al colgar, fuera sesión y precarga
+@app.post("/status")
+def call_status():
+    call_sid = request.values.get("CallSid") or ""
+    if request.values.get("CallStatus") in ("completed", "busy", "failed", "no-answer", "canceled"):
+        _end_session(call_sid)
+    return ok_json({"ok": True})
+
 # WhatsApp entrante (simple)
 @app.post("/whatsapp")
 def whatsapp_in():
@@ -832,15 +1643,78 @@ def ops_book_visit():
     email = d.get("email") or "test@example.com"
     if not item_id: return ok_json({"ok": False, "error":"Falta item_id"}, 400)
 
+    board_id = _board_from_request()
     it = monday_get_item(item_id)
-    m = BOARD_MAP.get(MONDAY_DEFAULT_BOARD_ID, BOARD_MAP[2147303762])
+    m = BOARD_MAP.get(board_id, BOARD_MAP[2147303762])
     fecha_iso = _get_date(it, m["fecha_visita"])
     nolon_text = _get_text(it, m.get("nolon",""))
-    sub_id = create_subitem_contact(item_id, MONDAY_DEFAULT_BOARD_ID,
+    sub_id = create_subitem_contact(item_id, board_id,
                                     title=f"{name} - {phone} - {email}",
                                     name=name, phone=phone, email=email,
                                     date_iso=fecha_iso, nolon_text=nolon_text)
     return ok_json({"ok": True, "subitem_id": sub_id})
 
+@app.post("/ops/prerender")
+def ops_prerender():
+    _require_ops()
+    board_id = _board_from_request()
+    threading.Thread(target=prerender_summaries, args=(board_id,), daemon=True).start()
+    return ok_json({"ok": True, "board_id": board_id, "started": True}, 202)
+
+# ------------- Arranque (preload de gunicorn + post_fork) -------------
+# gunicorn.conf.py importa la app en el master (preload_app), llama a warm_start() una vez
+# (snapshots compartidos copy-on-write) y en cada worker a warm_connections() +
+# start_background(). Sin gunicorn, start_background() se lanza en la primera petición.
+_READY: Dict[str, Any] = {}
+_BG_PID: Optional[int] = None
+_BG_LOCK = threading.Lock()
+
+def warm_start():
+    """Carga los snapshots de todos los boards (en paralelo) y los audios pre-renderizados
+    en disco antes de forkear."""
+    if not WARM_START: return
+    t = time.time()
+    # twilio.rest (pesado) se importa aquí, en el master: los workers comparten sus páginas
+    # y el cliente se crea barato en el primer WhatsApp (_twilio_client)
+    if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
+        import twilio.rest  # noqa: F401
+    log.info("warm_start audios pre-renderizados=%s", load_prerendered())
+    if not MONDAY_API_KEY: return
+    with ThreadPoolExecutor(max_workers=max(1, len(BOARD_MAP)), thread_name_prefix="warm") as pool:
+        for bid, fut in [(bid, pool.submit(in_background, board_items_page, bid, 300)) for bid in BOARD_MAP]:
+            try: log.info("warm_start board=%s items=%s", bid, len(fut.result()))
+            except Exception: log.exception("warm_start board=%s", bid)
+    _READY["warm_s"] = round(time.time() - t, 3)
+
+def warm_connections():
+    """Abre (TLS incluido) las conexiones keep-alive del worker antes del primer caller."""
+    if not WARM_START: return
+    for url, on in ((MONDAY_API_URL, MONDAY_API_KEY), ("https://api.openai.com/v1/models", OPENAI_API_KEY),
+                    ("https://api.elevenlabs.io/v1/models", ELEVEN_API_KEY)):
+        if not on: continue
+        try: _http().head(url, timeout=5)
+        except Exception: log.warning("warm_connections: %s no responde", url)
+
+def start_background():
+    """Hilos de fondo del proceso actual (una vez por pid: los hilos no sobreviven al fork)."""
+    global _BG_PID
+    with _BG_LOCK:
+        if _BG_PID == os.getpid(): return
+        _BG_PID = os.getpid()
+    if SEARCH_FEDERATED:
+        threading.Thread(target=_warm_boards_loop, daemon=True, name="warm-boards").start()
+    if PRERENDER_INTERVAL > 0 and prerender_leader():
+        threading.Thread(target=_prerender_loop, daemon=True, name="prerender-loop").start()
+
+def mark_ready(who: str) -> float:
+    _READY["ready_s"] = round(time.time() - _T0, 3)
+    log.info("%s listo en %.2fs (pid %s)", who, _READY["ready_s"], os.getpid())
+    return _READY["ready_s"]
+
+@app.before_request
+def _ensure_background():
+    if _BG_PID != os.getpid(): start_background()
+
 if __name__ == "__main__":
+    warm_start(); warm_connections(); mark_ready("app")
     app.run(host="0.0.0.0", port=int(os.getenv("PORT","5000")))
@@ -0,0 +1,27 @@
+# gunicorn.conf.py — arranque "preload": la app y los snapshots de Monday se cargan UNA vez
+# en el master y los workers los heredan copy-on-write al forkear.
+# Se usa con: gunicorn -c gunicorn.conf.py app:app
+import gc
+import os
+import time
+
+_T0 = time.time()
+
+workers = 2
+threads = int(os.getenv("WEB_THREADS", "8"))   # app.py dimensiona su pool de búsqueda con esto
+timeout = 90
+preload_app = True
+
+def when_ready(server):
+    # Master con la app ya importada (preload_app): boards y audios pre-renderizados una sola vez
+    import app
+    app.warm_start()
+    # Lo cargado hasta aquí no lo toca el GC → no ensucia páginas compartidas tras el fork
+    gc.freeze()
+    server.log.info("master listo en %.2fs", time.time() - _T0)
+
+def post_fork(server, worker):
+    import app
+    app.warm_connections()
+    app.start_background()
+    app.mark_ready(f"worker {worker.pid}")